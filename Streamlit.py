@@ -2,38 +2,1050 @@
 # Streamlit with MealDB API and ChatBot
 # =============================================================================
 
+import argparse
+import functools
+import hashlib
+import heapq
+import io
+import math
+import json
+import os
+import random
+import re
+import sqlite3
+import string
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import chain
+from urllib.parse import urlsplit
+
 import streamlit as st
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import ollama
 import openpyxl
 from langchain_community.llms import Ollama
 
-# Function to generate response using gemma:2b model
-def generate_response_gemma(prompt):
+# Chefs offered in the chatbot, mapped to the model, backend and generation options that serve them.
+# num_ctx is sent to Ollama explicitly; prompts are budgeted to num_ctx - num_predict so nothing is cut off.
+MODEL_CATALOGUE = {
+    "Chef De-Code": {
+        'model': 'gemma:2b',
+        'backend': 'ollama',
+        'options': {'temperature': 0.7, 'num_ctx': 2048, 'num_predict': 512},
+    },
+    "Chef App-etizer": {
+        'model': 'llama2',
+        'backend': 'langchain',
+        'options': {'temperature': 0.8, 'num_ctx': 4096, 'num_predict': 768},
+    },
+}
+
+# Local directories holding a Hugging Face tokenizer per model, e.g. "gemma:2b=/models/gemma-tokenizer,llama2=/models/llama2-tokenizer".
+# Models without one are counted with the 4-characters-per-token estimate.
+TOKENIZER_PATHS = dict(
+    entry.strip().split("=", 1) for entry in os.environ.get("LUMINE_TOKENIZER_PATHS", "").split(",") if "=" in entry
+)
+
+# Chefs whose models are preloaded on every Ollama host when the server starts
+WARM_UP_CHEFS = [chef.strip() for chef in os.environ.get("LUMINE_WARM_UP_CHEFS", ",".join(MODEL_CATALOGUE)).split(",") if chef.strip()]
+
+# Ollama servers the chatbot spreads its traffic over and how long each keeps a model loaded after a request
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_HOSTS = [host.strip() for host in os.environ.get("LUMINE_OLLAMA_HOSTS", OLLAMA_HOST).split(",") if host.strip()]
+OLLAMA_HEALTH_CHECK_SECONDS = float(os.environ.get("LUMINE_OLLAMA_HEALTH_CHECK_SECONDS", "15"))
+OLLAMA_KEEP_ALIVE = os.environ.get("LUMINE_OLLAMA_KEEP_ALIVE", "30m")
+
+# Size, lifetime and optional embedding-based near-duplicate matching of the chatbot response cache
+CHAT_CACHE_SIZE = int(os.environ.get("LUMINE_CHAT_CACHE_SIZE", "256"))
+CHAT_CACHE_TTL = int(os.environ.get("LUMINE_CHAT_CACHE_TTL", str(24 * 3600)))
+CHAT_CACHE_EMBED_MODEL = os.environ.get("LUMINE_CHAT_CACHE_EMBED_MODEL", "")
+CHAT_CACHE_SIMILARITY = float(os.environ.get("LUMINE_CHAT_CACHE_SIMILARITY", "0.95"))
+
+# Concurrent generations sent to Ollama (one per host by default, so every host gets traffic)
+# and how many more may wait in line before new ones are turned away
+INFERENCE_WORKERS = int(os.environ.get("LUMINE_INFERENCE_WORKERS", str(len(OLLAMA_HOSTS))))
+INFERENCE_QUEUE_LIMIT = int(os.environ.get("LUMINE_INFERENCE_QUEUE_LIMIT", "16"))
+
+# Maximum number of TheMealDB requests issued in parallel by the search helpers
+SEARCH_CONCURRENCY = int(os.environ.get("LUMINE_SEARCH_CONCURRENCY", "8"))
+
+# Minimum trigram similarity (0-1) for a product name to fuzzily match a recognized ingredient
+FUZZY_MATCH_THRESHOLD = float(os.environ.get("LUMINE_FUZZY_MATCH_THRESHOLD", "0.6"))
+
+# Chat memory limits: recent turns resent verbatim, characters of each kept reply and of the rolling summary,
+# and chat messages kept per session for display
+CHAT_MEMORY_TURNS = 3
+CHAT_TURN_CHARS = 1500
+CHAT_SUMMARY_CHARS = 800
+CHAT_HISTORY_MAX_MESSAGES = 40
+
+# Seconds between reruns that poll a background chatbot generation, and the slower interval while it waits in the queue
+CHAT_POLL_SECONDS = 0.25
+CHAT_QUEUED_POLL_SECONDS = 1.5
+
+# Number of catalogue recipes retrieved into a chatbot prompt, and how much of each recipe's instructions is kept
+RETRIEVAL_TOP_K = int(os.environ.get("LUMINE_RETRIEVAL_TOP_K", "3"))
+RETRIEVAL_INSTRUCTIONS_CHARS = 600
+
+# Column holding product names in uploaded sheets and how many rows are read per chunk when streaming them
+PRODUCT_NAME_COLUMN = 'Product Name'
+INGEST_CHUNK_ROWS = 5000
+
+# Leading words stripped from product names before matching: brands and retail descriptors.
+# Extra store brands can be added with LUMINE_BRAND_PREFIXES (comma-separated).
+PRODUCT_NAME_PREFIXES = [
+    'organic', 'bio', 'fresh', 'free range', 'mini', 'peeled', 'grated', 'frozen', 'premium', 'value', 'finest',
+] + [prefix.strip().lower() for prefix in os.environ.get("LUMINE_BRAND_PREFIXES", "").split(",") if prefix.strip()]
+
+# Parsed uploads and workbook sheet lists kept per session, keyed by a hash of the file's bytes
+UPLOAD_CACHE_ENTRIES = 8
+
+# Number of ranked recipe matches shown for an uploaded product list
+TOP_RECIPE_MATCHES = 5
+
+# Timeout, retry and backoff settings for the shared TheMealDB HTTP client
+HTTP_TIMEOUT = float(os.environ.get("LUMINE_HTTP_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.environ.get("LUMINE_HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_SECONDS = float(os.environ.get("LUMINE_HTTP_BACKOFF_SECONDS", "0.5"))
+HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Location and size limit of the on-disk TheMealDB response cache
+MEALDB_CACHE_PATH = os.environ.get("LUMINE_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "lumine", "mealdb.sqlite"))
+MEALDB_CACHE_MAX_BYTES = int(os.environ.get("LUMINE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Seconds the ingredient, category and area lists are memoized in-process before refetching
+REFERENCE_DATA_TTL = int(os.environ.get("LUMINE_REFERENCE_DATA_TTL", str(6 * 3600)))
+
+# TheMealDB endpoints serving the reference lists
+REFERENCE_DATA_ENDPOINTS = ('categories.php', 'list.php')
+
+# Location of the local TheMealDB catalogue snapshot written by `python Streamlit.py sync-catalogue`
+MEALDB_CATALOGUE_PATH = os.environ.get("LUMINE_CATALOGUE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "lumine", "catalogue.json"))
+
+# Time-to-live in seconds for cached responses of each TheMealDB endpoint
+MEALDB_CACHE_TTLS = {
+    'categories.php': 7 * 24 * 3600,
+    'list.php': 7 * 24 * 3600,
+    'lookup.php': 24 * 3600,
+    'filter.php': 6 * 3600,
+}
+
+# Function to get the long-lived client for a chatbot backend, built once per process, model, host and options
+# No spinner on this and the other getters used by inference and warm-up threads, which have no script context to draw it in
+@st.experimental_singleton(show_spinner=False)
+def get_model_client(backend, model, host=OLLAMA_HOST, options=()):
+    if backend == "ollama":
+        # The client holds a persistent HTTP connection pool to the Ollama server
+        return ollama.Client(host=host)
+    if backend == "langchain":
+        return Ollama(model=model, base_url=host, keep_alive=OLLAMA_KEEP_ALIVE, **dict(options))
+    raise ValueError(f"Unknown model backend: {backend}")
+
+# Least-outstanding-requests balancer over the Ollama hosts with health checks and failover
+class OllamaRouter:
+    def __init__(self, hosts, health_check_seconds):
+        self.hosts = {host: {'healthy': True, 'outstanding': 0, 'requests': 0, 'failures': 0} for host in hosts}
+        self._lock = threading.Lock()
+        # Health checks also run for a single host, so a host marked unhealthy after a failure can recover
+        threading.Thread(target=self._check_health, args=(health_check_seconds,), name="lumine-ollama-health", daemon=True).start()
+
+    def _check_health(self, interval):
+        while True:
+            for host in list(self.hosts):
+                try:
+                    healthy = requests.get(f"{host}/api/tags", timeout=2).status_code == 200
+                except requests.exceptions.RequestException:
+                    healthy = False
+                with self._lock:
+                    self.hosts[host]['healthy'] = healthy
+            time.sleep(interval)
+
+    # Picks the healthy host with the fewest requests in flight, falling back to unhealthy ones
+    def _acquire(self, exclude):
+        with self._lock:
+            candidates = [host for host in self.hosts if host not in exclude]
+            if not candidates:
+                return None
+            host = min(candidates, key=lambda h: (not self.hosts[h]['healthy'], self.hosts[h]['outstanding']))
+            self.hosts[host]['outstanding'] += 1
+            self.hosts[host]['requests'] += 1
+            return host
+
+    def _release(self, host, failed):
+        with self._lock:
+            self.hosts[host]['outstanding'] -= 1
+            if failed:
+                self.hosts[host]['failures'] += 1
+                self.hosts[host]['healthy'] = False
+
+    # Streams from open_stream(host), failing over to another host if one fails before its first chunk
+    def stream(self, open_stream):
+        tried = set()
+        last_error = None
+        while True:
+            host = self._acquire(tried)
+            if host is None:
+                raise last_error or RuntimeError("No Ollama hosts configured")
+            tried.add(host)
+            started = False
+            failed = False
+            try:
+                for chunk in open_stream(host):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                failed = True
+                if started:
+                    raise
+                last_error = e
+            finally:
+                self._release(host, failed)
+
+    # Runs call(host) on the least busy host, failing over like stream()
+    def run(self, call):
+        for result in self.stream(lambda host: [call(host)]):
+            return result
+
+    def summary(self):
+        with self._lock:
+            return {host: dict(state) for host, state in self.hosts.items()}
+
+# Function to get the process-wide router over the configured Ollama hosts
+@st.experimental_singleton(show_spinner=False)
+def get_ollama_router():
+    return OllamaRouter(OLLAMA_HOSTS, OLLAMA_HEALTH_CHECK_SECONDS)
+
+# Function to generate response using a model served through the ollama client
+def generate_response_ollama(prompt, model, options=None, metrics=None):
     try:
-        response = ollama.generate(model='gemma:2b', prompt=prompt)
+        response = get_ollama_router().run(
+            lambda host: get_model_client('ollama', model, host).generate(model=model, prompt=prompt, options=options, keep_alive=OLLAMA_KEEP_ALIVE)
+        )
+        record_ollama_counts(response, metrics)
         return response['response']
     except requests.exceptions.RequestException as e:
-        return f"An error occurred: {e}"
+        return generation_error(f"An error occurred: {e}", metrics)
     except Exception as e:
-        return f"An unexpected error occurred: {e}"
+        return generation_error(f"An unexpected error occurred: {e}", metrics)
 
-# Function to generate response using llama2 model
-def generate_response_llama(prompt):
+# Function to generate response using a model served through LangChain
+def generate_response_langchain(prompt, model, options=None, metrics=None):
     try:
-        llm = Ollama(model="llama2")
-        response = llm.invoke(prompt)
+        options = tuple(sorted((options or {}).items()))
+        response = get_ollama_router().run(lambda host: get_model_client('langchain', model, host, options).invoke(prompt))
         return response
     except requests.exceptions.RequestException as e:
-        return f"An error occurred: {e}"
+        return generation_error(f"An error occurred: {e}", metrics)
+    except Exception as e:
+        return generation_error(f"An unexpected error occurred: {e}", metrics)
+
+# Function to stream a response from a model served through the ollama client chunk by chunk
+def stream_response_ollama(prompt, model, options=None, metrics=None):
+    try:
+        chunks = get_ollama_router().stream(
+            lambda host: get_model_client('ollama', model, host).generate(model=model, prompt=prompt, options=options, stream=True, keep_alive=OLLAMA_KEEP_ALIVE)
+        )
+        for chunk in chunks:
+            if chunk.get('done'):
+                record_ollama_counts(chunk, metrics)
+            yield chunk['response']
+    except requests.exceptions.RequestException as e:
+        yield generation_error(f"An error occurred: {e}", metrics)
+    except Exception as e:
+        yield generation_error(f"An unexpected error occurred: {e}", metrics)
+
+# Function to stream a response from a model served through LangChain chunk by chunk
+def stream_response_langchain(prompt, model, options=None, metrics=None):
+    try:
+        options = tuple(sorted((options or {}).items()))
+        for chunk in get_ollama_router().stream(lambda host: get_model_client('langchain', model, host, options).stream(prompt)):
+            yield chunk
+    except requests.exceptions.RequestException as e:
+        yield generation_error(f"An error occurred: {e}", metrics)
     except Exception as e:
-        return f"An unexpected error occurred: {e}"
+        yield generation_error(f"An unexpected error occurred: {e}", metrics)
+
+# Function to flag a generation as failed in its metrics and return the error message shown in its place
+def generation_error(message, metrics):
+    # Streams can fail after some chunks, so the flag rather than the text tells callers not to cache or remember the answer
+    if metrics is not None:
+        metrics['error'] = message
+    return message
+
+# Function to copy the token counts and generation speed Ollama reports into a metrics dict
+def record_ollama_counts(response, metrics):
+    if metrics is None:
+        return
+    if response.get('prompt_eval_count') is not None:
+        metrics['prompt_tokens'] = response['prompt_eval_count']
+    if response.get('eval_count') is not None:
+        metrics['completion_tokens'] = response['eval_count']
+        if response.get('eval_duration'):
+            metrics['tokens_per_second'] = response['eval_count'] / (response['eval_duration'] / 1e9)
+
+# Function to fill in the metrics of a finished generation and add them to the per-model totals
+def finish_generation_metrics(chef, prompt, completion, metrics, started_at, first_token_at):
+    finished_at = time.perf_counter()
+    metrics.setdefault('prompt_tokens', count_tokens(chef, prompt))
+    metrics.setdefault('completion_tokens', count_tokens(chef, completion))
+    metrics['seconds'] = finished_at - started_at
+    if first_token_at is not None:
+        metrics['time_to_first_token'] = first_token_at - started_at
+        if 'tokens_per_second' not in metrics and finished_at > first_token_at:
+            metrics['tokens_per_second'] = metrics['completion_tokens'] / (finished_at - first_token_at)
+    get_generation_stats().record(MODEL_CATALOGUE[chef]['model'], metrics)
+
+# Function to generate a response from the model behind a chef in the catalogue
+def generate_response(chef, prompt, metrics=None):
+    spec = MODEL_CATALOGUE[chef]
+    metrics = {} if metrics is None else metrics
+    generate = generate_response_ollama if spec['backend'] == 'ollama' else generate_response_langchain
+    started_at = time.perf_counter()
+    response = generate(prompt, spec['model'], spec['options'], metrics)
+    finish_generation_metrics(chef, prompt, response, metrics, started_at, None)
+    return response
+
+# Function to stream a response from the model behind a chef in the catalogue
+def stream_response(chef, prompt, metrics=None):
+    spec = MODEL_CATALOGUE[chef]
+    metrics = {} if metrics is None else metrics
+    stream = stream_response_ollama if spec['backend'] == 'ollama' else stream_response_langchain
+    started_at = time.perf_counter()
+    first_token_at = None
+    chunks = []
+    for chunk in stream(prompt, spec['model'], spec['options'], metrics):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        chunks.append(chunk)
+        yield chunk
+    finish_generation_metrics(chef, prompt, "".join(chunks), metrics, started_at, first_token_at)
+
+# Per-model totals of prompt and completion tokens and generation time, for sizing inference hardware
+class GenerationStats:
+    def __init__(self):
+        self.models = defaultdict(lambda: {'calls': 0, 'errors': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'seconds': 0.0})
+        self._lock = threading.Lock()
+
+    def record(self, model, metrics):
+        with self._lock:
+            totals = self.models[model]
+            totals['calls'] += 1
+            totals['errors'] += 'error' in metrics
+            totals['prompt_tokens'] += metrics['prompt_tokens']
+            totals['completion_tokens'] += metrics['completion_tokens']
+            totals['seconds'] += metrics['seconds']
+
+    def summary(self):
+        with self._lock:
+            return {
+                model: {**totals, 'completion_tokens_per_second': totals['completion_tokens'] / totals['seconds'] if totals['seconds'] else 0.0}
+                for model, totals in self.models.items()
+            }
+
+# Function to get the process-wide generation statistics
+@st.experimental_singleton(show_spinner=False)
+def get_generation_stats():
+    return GenerationStats()
+
+# Function to load a model's tokenizer from its configured local directory, or None when there is none
+@st.experimental_singleton(show_spinner=False)
+def get_tokenizer(model):
+    path = TOKENIZER_PATHS.get(model)
+    if not path:
+        return None
+    try:
+        from transformers import AutoTokenizer
+        # Never reach out to the Hugging Face hub; air-gapped nodes would stall until it times out
+        return AutoTokenizer.from_pretrained(path, local_files_only=True)
+    except Exception:
+        return None
+
+# Function to count the tokens a chef's model sees for a text, estimating 4 characters per token without a tokenizer
+def count_tokens(chef, text):
+    tokenizer = get_tokenizer(MODEL_CATALOGUE[chef]['model'])
+    if tokenizer is None:
+        return math.ceil(len(text) / 4)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+# Function to cut a text down to a token budget, keeping its beginning and end
+def truncate_to_token_budget(chef, text, budget):
+    if count_tokens(chef, text) <= budget:
+        return text
+    marker = " [...] "
+    tokenizer = get_tokenizer(MODEL_CATALOGUE[chef]['model'])
+    if tokenizer is None:
+        keep = max(budget * 4 - len(marker), 0) // 2
+        return text[:keep] + marker + text[len(text) - keep:]
+    token_ids = tokenizer.encode(text, add_special_tokens=False)
+    keep = max(budget - count_tokens(chef, marker), 0) // 2
+    return tokenizer.decode(token_ids[:keep]) + marker + tokenizer.decode(token_ids[len(token_ids) - keep:])
+
+# Function to get a chef's prompt token budget: the context window minus the room reserved for the answer
+def prompt_token_budget(chef):
+    options = MODEL_CATALOGUE[chef]['options']
+    return options['num_ctx'] - options['num_predict']
+
+# Function to build the prompt for a chef's model within its token budget, returning the prompt and recipes used
+def build_prompt(chef, question, memory=None):
+    budget = prompt_token_budget(chef)
+    question = truncate_to_token_budget(chef, question, budget)
+    meals = retrieve_recipes(question)
+    summary = memory['summary'] if memory else ""
+    turns = list(memory['turns']) if memory else []
+
+    # Drop the least relevant recipes, then the oldest turns, then the summary until the prompt fits
+    prompt = render_prompt(question, meals, summary, turns)
+    while count_tokens(chef, prompt) > budget and (meals or turns or summary):
+        if meals:
+            meals = meals[:-1]
+        elif turns:
+            turns = turns[1:]
+        else:
+            summary = ""
+        prompt = render_prompt(question, meals, summary, turns)
+    return prompt, meals
+
+# Function to preload the models of the given chefs on every Ollama host, returning per-model status
+def warm_up_models(chefs):
+    status = {}
+    for model in dict.fromkeys(MODEL_CATALOGUE[chef]['model'] for chef in chefs if chef in MODEL_CATALOGUE):
+        for host in OLLAMA_HOSTS:
+            try:
+                # An empty prompt makes Ollama load the model without generating anything
+                get_model_client('ollama', model, host).generate(model=model, prompt='', keep_alive=OLLAMA_KEEP_ALIVE)
+                status[f"{model} @ {host}"] = "ready"
+            except Exception as e:
+                status[f"{model} @ {host}"] = f"failed: {e}"
+    return status
+
+# Function to start warming up models in the background, once per server process
+@st.experimental_singleton
+def start_model_warm_up():
+    status = {chef: "pending" for chef in WARM_UP_CHEFS}
+
+    def run():
+        status.clear()
+        status.update(warm_up_models(WARM_UP_CHEFS))
+
+    threading.Thread(target=run, name="lumine-model-warm-up", daemon=True).start()
+    return status
+
+# Function to reduce a prompt to its cache key form: case-folded, single-spaced, no trailing punctuation
+def normalize_prompt(prompt):
+    return " ".join(prompt.casefold().split()).rstrip("?!. ")
+
+# Function to compute the cosine similarity of two embedding vectors
+def cosine_similarity(a, b):
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
+
+# LRU cache of chatbot responses keyed by model and normalized prompt, with optional similarity lookup
+class ChatResponseCache:
+    def __init__(self, max_entries, ttl, embed_model="", similarity=1.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_model = embed_model
+        self.similarity = similarity
+        self.entries = OrderedDict()
+        self.stats = {'hits': 0, 'similar_hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def _embed(self, prompt):
+        if not self.embed_model:
+            return None
+        try:
+            client = get_model_client('ollama', self.embed_model)
+            return client.embeddings(model=self.embed_model, prompt=prompt)['embedding']
+        except Exception:
+            # Near-duplicate matching is best effort; exact matching keeps working without it
+            return None
+
+    # Returns (response, "exact" or "similar") on a hit and (None, None) on a miss
+    def get(self, model, prompt):
+        key = (model, normalize_prompt(prompt))
+        now = time.time()
+        with self._lock:
+            for stale_key in [k for k, entry in self.entries.items() if entry['expires_at'] <= now]:
+                del self.entries[stale_key]
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return self.entries[key]['response'], "exact"
+            candidates = [(k, entry) for k, entry in self.entries.items() if k[0] == model and entry['embedding']]
+
+        embedding = self._embed(key[1]) if candidates else None
+        if embedding:
+            best_key, best_score = max(
+                ((k, cosine_similarity(embedding, entry['embedding'])) for k, entry in candidates),
+                key=lambda item: item[1],
+            )
+            if best_score >= self.similarity:
+                with self._lock:
+                    if best_key in self.entries:
+                        self.entries.move_to_end(best_key)
+                        self.stats['similar_hits'] += 1
+                        return self.entries[best_key]['response'], "similar"
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None, None
+
+    def put(self, model, prompt, response):
+        key = (model, normalize_prompt(prompt))
+        embedding = self._embed(key[1])
+        with self._lock:
+            self.entries[key] = {'response': response, 'embedding': embedding, 'expires_at': time.time() + self.ttl}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def summary(self):
+        with self._lock:
+            return {**self.stats, 'entries': len(self.entries)}
+
+# Function to get the process-wide chatbot response cache
+@st.experimental_singleton
+def get_chat_response_cache():
+    return ChatResponseCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL, CHAT_CACHE_EMBED_MODEL, CHAT_CACHE_SIMILARITY)
+
+# A queued generation whose output accumulates on the job so the submitting session can poll it across reruns
+class InferenceJob:
+    def __init__(self, stream_fn, prompt):
+        self.stream_fn = stream_fn
+        self.prompt = prompt
+        self.started = threading.Event()
+        self.done = threading.Event()
+        self.cancelled = threading.Event()
+        self.error = None
+        self._chunks = []
+        self._lock = threading.Lock()
+
+    def append(self, chunk):
+        with self._lock:
+            self._chunks.append(chunk)
+
+    @property
+    def text(self):
+        with self._lock:
+            return "".join(self._chunks)
+
+# Process-wide FIFO scheduler running chatbot generations on a bounded pool of worker threads
+class InferenceScheduler:
+    def __init__(self, workers, queue_limit):
+        self.queue_limit = queue_limit
+        self.pending = deque()
+        self.stats = {'submitted': 0, 'rejected': 0, 'cancelled': 0, 'completed': 0, 'running': 0}
+        self._condition = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"lumine-inference-{i}", daemon=True).start()
+
+    # Returns the queued job, or None when the queue is full and the request is turned away
+    def submit(self, stream_fn, prompt):
+        with self._condition:
+            if len(self.pending) >= self.queue_limit:
+                self.stats['rejected'] += 1
+                return None
+            job = InferenceJob(stream_fn, prompt)
+            self.pending.append(job)
+            self.stats['submitted'] += 1
+            self._condition.notify()
+            return job
+
+    # Stops a job: a queued job never starts and a running one stops generating at its next chunk
+    def cancel(self, job):
+        with self._condition:
+            if job.done.is_set() or job.cancelled.is_set():
+                return
+            job.cancelled.set()
+            self.stats['cancelled'] += 1
+            if job in self.pending:
+                self.pending.remove(job)
+                job.done.set()
+
+    # 1-based place in line of a job that has not started yet, 0 once it is running
+    def position(self, job):
+        with self._condition:
+            try:
+                return self.pending.index(job) + 1
+            except ValueError:
+                return 0
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self.pending:
+                    self._condition.wait()
+                job = self.pending.popleft()
+                self.stats['running'] += 1
+            job.started.set()
+            stream = job.stream_fn(job.prompt)
+            try:
+                for chunk in stream:
+                    if job.cancelled.is_set():
+                        break
+                    job.append(chunk)
+            except Exception as e:
+                job.error = f"An unexpected error occurred: {e}"
+                job.append(job.error)
+            finally:
+                # Closing the stream drops the connection to Ollama, which stops the abandoned generation
+                stream.close()
+                job.done.set()
+                with self._condition:
+                    self.stats['running'] -= 1
+                    self.stats['completed'] += 1
+
+    def summary(self):
+        with self._condition:
+            return {**self.stats, 'queued': len(self.pending)}
+
+# Function to get the process-wide inference scheduler shared by all sessions
+@st.experimental_singleton
+def get_inference_scheduler():
+    return InferenceScheduler(INFERENCE_WORKERS, INFERENCE_QUEUE_LIMIT)
+
+# Pooled keep-alive HTTP client with bounded retries and per-endpoint latency metrics
+class HttpClient:
+    def __init__(self, pool_size, timeout, max_retries, backoff_seconds):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.metrics = defaultdict(lambda: {'requests': 0, 'retries': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        self._lock = threading.Lock()
+
+    def _record(self, endpoint, elapsed, retried, failed):
+        with self._lock:
+            metrics = self.metrics[endpoint]
+            metrics['requests'] += 1
+            metrics['retries'] += int(retried)
+            metrics['errors'] += int(failed)
+            metrics['total_seconds'] += elapsed
+            metrics['max_seconds'] = max(metrics['max_seconds'], elapsed)
+
+    def get(self, url):
+        endpoint = urlsplit(url).path.rsplit('/', 1)[-1]
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            error = None
+            response = None
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            retryable = error is not None or response.status_code in HTTP_RETRY_STATUSES
+            self._record(endpoint, time.perf_counter() - start, attempt > 0, retryable)
+
+            if not retryable:
+                return response
+            if attempt == self.max_retries:
+                if response is not None:
+                    return response
+                raise error
+
+            # Exponential backoff with full jitter so parallel callers do not retry in lockstep
+            time.sleep(random.uniform(0, self.backoff_seconds * 2 ** attempt))
+
+    def summary(self):
+        with self._lock:
+            return {
+                endpoint: {**metrics, 'avg_seconds': metrics['total_seconds'] / metrics['requests']}
+                for endpoint, metrics in self.metrics.items()
+            }
+
+# Function to get the process-wide HTTP client shared by all TheMealDB helpers
+# No spinner: thread-pool workers call this, and drawing one off the script thread logs missing ScriptRunContext warnings
+@st.experimental_singleton(show_spinner=False)
+def get_http_client():
+    return HttpClient(max(SEARCH_CONCURRENCY, 10), HTTP_TIMEOUT, HTTP_MAX_RETRIES, HTTP_BACKOFF_SECONDS)
+
+# Response stand-in served from the on-disk cache
+class CachedResponse:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+# SQLite-backed store of successful TheMealDB responses with per-endpoint TTLs and LRU eviction
+class ResponseCache:
+    def __init__(self, path, max_bytes):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, body TEXT NOT NULL, size INTEGER NOT NULL, "
+            "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, url, ttl):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT body, fetched_at FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            body, fetched_at = row
+            if now - fetched_at > ttl:
+                self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._conn.commit()
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url))
+            self._conn.commit()
+            self.stats['hits'] += 1
+            return body
+
+    def put(self, url, body):
+        now = time.time()
+        size = len(body.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, body, size, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (url, body, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Drop the least recently used entries until the store fits the size limit
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self._conn.execute("SELECT url, size FROM responses ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+            self.stats['evictions'] += 1
+
+    def summary(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {**self.stats, 'entries': entries, 'bytes': total}
+
+    # Drops every cached response, or only those of the given endpoints (e.g. "list.php")
+    def clear(self, endpoints=None):
+        with self._lock:
+            if endpoints is None:
+                self._conn.execute("DELETE FROM responses")
+            else:
+                for endpoint in endpoints:
+                    self._conn.execute("DELETE FROM responses WHERE url LIKE ?", (f"%/{endpoint}%",))
+            self._conn.commit()
+
+# Function to get the process-wide TheMealDB response cache, without a spinner as it is also called from pool threads
+@st.experimental_singleton(show_spinner=False)
+def get_response_cache():
+    return ResponseCache(MEALDB_CACHE_PATH, MEALDB_CACHE_MAX_BYTES)
+
+# Function to GET a TheMealDB URL, serving successful responses from the on-disk cache
+def mealdb_get(url):
+    endpoint = urlsplit(url).path.rsplit('/', 1)[-1]
+    ttl = MEALDB_CACHE_TTLS.get(endpoint, 0)
+    cache = get_response_cache()
+
+    if ttl:
+        body = cache.get(url, ttl)
+        if body is not None:
+            return CachedResponse(body)
+
+    response = get_http_client().get(url)
+    if ttl and response.status_code == 200:
+        try:
+            response.json()
+        except ValueError:
+            return response
+        cache.put(url, response.text)
+    return response
+
+# In-memory query engine over a local TheMealDB catalogue snapshot
+class MealCatalogue:
+    def __init__(self, snapshot):
+        self.ingredients = snapshot['ingredients']
+        self.categories = snapshot['categories']
+        self.areas = snapshot['areas']
+        self.meals = {meal['idMeal']: meal for meal in snapshot['meals']}
+
+        # Inverted indexes from case-folded ingredient, category and area to meal IDs
+        self.by_ingredient = defaultdict(set)
+        self.by_category = defaultdict(set)
+        self.by_area = defaultdict(set)
+        for meal_id, meal in self.meals.items():
+            for i in range(1, 21):
+                ingredient = meal.get(f'strIngredient{i}')
+                if ingredient and ingredient.strip():
+                    self.by_ingredient[ingredient.strip().casefold()].add(meal_id)
+            if meal.get('strCategory'):
+                self.by_category[meal['strCategory'].casefold()].add(meal_id)
+            if meal.get('strArea'):
+                self.by_area[meal['strArea'].casefold()].add(meal_id)
+
+    # Same shape as the entries returned by filter.php, sorted by meal name
+    def _summaries(self, meal_ids):
+        meals = sorted((self.meals[meal_id] for meal_id in meal_ids), key=lambda meal: meal['strMeal'])
+        return [{'strMeal': meal['strMeal'], 'strMealThumb': meal['strMealThumb'], 'idMeal': meal['idMeal']} for meal in meals]
+
+    def filter_by_ingredient(self, ingredient):
+        return self._summaries(self.by_ingredient.get(ingredient.strip().casefold(), ()))
+
+    def filter_by_category_and_area(self, category, area):
+        # "All" is the UI's placeholder for an unconstrained filter
+        meal_ids = None
+        if category != "All":
+            meal_ids = set(self.by_category.get(category.casefold(), ()))
+        if area != "All":
+            area_ids = self.by_area.get(area.casefold(), set())
+            meal_ids = area_ids if meal_ids is None else meal_ids & area_ids
+        return self._summaries(meal_ids or ())
+
+    def lookup(self, recipe_id):
+        return self.meals.get(str(recipe_id))
+
+    def rank_by_ingredients(self, ingredient_names, top_k=TOP_RECIPE_MATCHES):
+        # Overlap counting over the inverted index; ties go to the alphabetically first meal
+        match_counts = Counter()
+        for name in {name.strip().casefold() for name in ingredient_names}:
+            match_counts.update(self.by_ingredient.get(name, ()))
+        ranked = heapq.nsmallest(top_k, match_counts.items(), key=lambda item: (-item[1], self.meals[item[0]]['strMeal']))
+        return [(self.meals[meal_id], match_count) for meal_id, match_count in ranked]
+
+# Words too common in cooking questions to help pick a recipe
+RETRIEVAL_STOPWORDS = {
+    'a', 'an', 'and', 'the', 'with', 'of', 'for', 'to', 'in', 'on', 'me', 'my', 'i', 'you', 'could', 'can',
+    'would', 'please', 'suggest', 'recipe', 'recipes', 'make', 'cook', 'how', 'what', 'some', 'is', 'it', 'or',
+}
+
+# Function to split text into lowercase search terms
+def retrieval_terms(text):
+    return [term for term in re.findall(r"[a-z0-9]+", (text or "").casefold()) if term not in RETRIEVAL_STOPWORDS]
+
+# BM25 index over the catalogue's meal names, categories, areas, ingredients and instructions
+class RecipeIndex:
+    def __init__(self, meals, k1=1.5, b=0.75):
+        self.meals = meals
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc_id, meal in enumerate(meals):
+            ingredients = " ".join(meal.get(f'strIngredient{i}') or "" for i in range(1, 21))
+            # Names and ingredients are repeated so they outweigh incidental words in the instructions
+            text = " ".join([meal['strMeal']] * 2 + [ingredients] * 2 + [meal.get('strCategory') or "", meal.get('strArea') or "", meal.get('strInstructions') or ""])
+            terms = Counter(retrieval_terms(text))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings[term].append((doc_id, frequency))
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def search(self, query, top_k=RETRIEVAL_TOP_K):
+        scores = Counter()
+        for term in set(retrieval_terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.meals) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return [self.meals[doc_id] for doc_id, _ in scores.most_common(top_k)]
+
+# Function to build the recipe retrieval index over the local catalogue once per process
+@st.experimental_singleton
+def build_recipe_index():
+    return RecipeIndex(list(load_local_catalogue().meals.values()))
+
+# Function to get the process-wide recipe retrieval index, or None without a local catalogue
+def get_recipe_index():
+    # Like get_local_catalogue, the missing case is checked on every call rather than cached
+    if get_local_catalogue() is None:
+        return None
+    return build_recipe_index()
+
+# Function to find the catalogue recipes most relevant to a chatbot question
+def retrieve_recipes(question):
+    recipe_index = get_recipe_index()
+    return recipe_index.search(question) if recipe_index else []
+
+# Function to add grounding recipes and conversation memory to a chatbot question
+def render_prompt(question, meals, summary="", turns=()):
+    if not meals and not summary and not turns:
+        return question
+
+    parts = ["You are Lumine, a friendly chef."]
+    if meals:
+        parts[0] += " Use the recipes from Lumine's recipe book below when they are relevant to the question, and say which recipe you are drawing on."
+    for meal in meals:
+        ingredients = ", ".join(
+            f"{(meal.get(f'strMeasure{i}') or '').strip()} {meal[f'strIngredient{i}'].strip()}".strip()
+            for i in range(1, 21) if (meal.get(f'strIngredient{i}') or '').strip()
+        )
+        instructions = (meal.get('strInstructions') or '')[:RETRIEVAL_INSTRUCTIONS_CHARS]
+        parts.append(f"Recipe: {meal['strMeal']} ({meal.get('strCategory')}, {meal.get('strArea')})\nIngredients: {ingredients}\nInstructions: {instructions}")
+    if summary:
+        parts.append(f"Earlier in this conversation:\n{summary}")
+    if turns:
+        parts.append("Recent conversation:\n" + "\n".join(f"Aspiring Chef: {user}\nLumine: {bot}" for user, bot in turns))
+    parts.append(f"Question: {question}")
+    return "\n\n".join(parts)
+
+# Function to compress a finished chat turn into one line of the rolling conversation summary
+def summarize_turn(user_message, bot_message):
+    first_sentence = re.split(r"(?<=[.!?])\s", bot_message.strip(), maxsplit=1)[0]
+    return f"- Asked: {user_message[:120]} / Suggested: {first_sentence[:160]}"
+
+# Function to add a turn to a session's chat memory, folding turns beyond the verbatim window into the summary
+def remember_turn(memory, user_message, bot_message):
+    memory['turns'].append((user_message, bot_message[:CHAT_TURN_CHARS]))
+    while len(memory['turns']) > CHAT_MEMORY_TURNS:
+        old_user, old_bot = memory['turns'].pop(0)
+        lines = (memory['summary'] + "\n" + summarize_turn(old_user, old_bot)).strip().splitlines()
+        # The summary keeps its most recent lines, so its size stays fixed however long the chat runs
+        while len(lines) > 1 and len("\n".join(lines)) > CHAT_SUMMARY_CHARS:
+            lines.pop(0)
+        memory['summary'] = "\n".join(lines)
+
+# Function to snapshot the full TheMealDB catalogue into a local JSON file
+def sync_catalogue(path=MEALDB_CATALOGUE_PATH, max_workers=None):
+    def get_json(url):
+        response = get_http_client().get(url)
+        response.raise_for_status()
+        return response.json()
+
+    base_url = 'https://www.themealdb.com/api/json/v1/1'
+    ingredients = get_json(f'{base_url}/list.php?i=list')['meals']
+    categories = [category['strCategory'] for category in get_json(f'{base_url}/categories.php')['categories']]
+    areas = [area['strArea'] for area in get_json(f'{base_url}/list.php?a=list')['meals']]
+
+    # search.php?f= returns full meal details for every meal starting with a letter
+    letters = string.ascii_lowercase + string.digits
+    with ThreadPoolExecutor(max_workers=max_workers or SEARCH_CONCURRENCY) as executor:
+        pages = list(executor.map(lambda letter: get_json(f'{base_url}/search.php?f={letter}')['meals'] or [], letters))
+    meals = list({meal['idMeal']: meal for page in pages for meal in page}.values())
+
+    snapshot = {'synced_at': time.time(), 'ingredients': ingredients, 'categories': categories, 'areas': areas, 'meals': meals}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+    print(f"Synced {len(meals)} meals, {len(ingredients)} ingredients, {len(categories)} categories and {len(areas)} areas to {path}")
+
+# Function to load the local catalogue snapshot once per process
+@st.experimental_singleton
+def load_local_catalogue():
+    with open(MEALDB_CATALOGUE_PATH, encoding='utf-8') as f:
+        return MealCatalogue(json.load(f))
+
+# Function to get the process-wide local catalogue, or None when no snapshot has been synced
+def get_local_catalogue():
+    # The missing case is not cached, so a snapshot synced while the server runs is picked up on the next call
+    if not os.path.exists(MEALDB_CATALOGUE_PATH):
+        return None
+    return load_local_catalogue()
+
+# Process-wide memo of reference data with TTLs, per-function hit/miss counters and invalidation
+class MemoStore:
+    def __init__(self):
+        self.entries = {}
+        self.stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'invalidations': 0})
+        self._lock = threading.Lock()
+        self._key_locks = defaultdict(threading.Lock)
+
+    def get(self, key, count=True):
+        with self._lock:
+            entry = self.entries.get(key)
+            found = bool(entry) and entry[1] > time.time()
+            if count:
+                self.stats[key[0]]['hits' if found else 'misses'] += 1
+            return found, entry[0] if found else None
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self.entries[key] = (value, time.time() + ttl)
+
+    def key_lock(self, key):
+        with self._lock:
+            return self._key_locks[key]
+
+    def invalidate(self, name=None):
+        with self._lock:
+            for key in [key for key in self.entries if name is None or key[0] == name]:
+                del self.entries[key]
+                self.stats[key[0]]['invalidations'] += 1
+
+    def summary(self):
+        with self._lock:
+            cached = Counter(key[0] for key, entry in self.entries.items() if entry[1] > time.time())
+            return {name: {**stats, 'cached': cached[name]} for name, stats in self.stats.items()}
+
+# Function to get the process-wide reference data memo
+@st.experimental_singleton
+def get_memo_store():
+    return MemoStore()
+
+# Decorator memoizing a fetcher across reruns and sessions; failed (None) results are not kept
+def memoize_reference_data(ttl=REFERENCE_DATA_TTL):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            store = get_memo_store()
+            key = (func.__name__, args)
+            found, value = store.get(key)
+            if found:
+                return value
+
+            # Only one session refetches an expired entry; the others wait and reuse its result
+            with store.key_lock(key):
+                found, value = store.get(key, count=False)
+                if found:
+                    return value
+                value = func(*args)
+                if value is not None:
+                    store.put(key, value, ttl)
+                return value
+
+        wrapper.invalidate = lambda: get_memo_store().invalidate(func.__name__)
+        return wrapper
+    return decorator
+
+# Function to force the ingredient, category and area lists to be refetched from TheMealDB
+def refresh_reference_data():
+    # Both layers must go: the memo would otherwise refill from the on-disk response cache
+    get_memo_store().invalidate()
+    get_response_cache().clear(REFERENCE_DATA_ENDPOINTS)
+    # A re-synced catalogue snapshot is read and indexed again on next use
+    load_local_catalogue.clear()
+    build_recipe_index.clear()
 
 # Function to fetch the list of recognized ingredients from TheMealDB API
+@memoize_reference_data()
 def fetch_ingredient_list():
+    catalogue = get_local_catalogue()
+    if catalogue:
+        return catalogue.ingredients
+
     url = 'https://www.themealdb.com/api/json/v1/1/list.php?i=list'
-    response = requests.get(url)
+    response = mealdb_get(url)
     if response.status_code == 200:
         try:
             return response.json()['meals']
@@ -45,9 +1057,14 @@ def fetch_ingredient_list():
         return None
 
 # Function to fetch the list of meal categories from TheMealDB API
+@memoize_reference_data()
 def fetch_category_list():
+    catalogue = get_local_catalogue()
+    if catalogue:
+        return catalogue.categories
+
     url = 'https://www.themealdb.com/api/json/v1/1/categories.php'
-    response = requests.get(url)
+    response = mealdb_get(url)
     if response.status_code == 200:
         try:
             return [category['strCategory'] for category in response.json()['categories']]
@@ -59,9 +1076,14 @@ def fetch_category_list():
         return None
 
 # Function to fetch the list of meal areas from TheMealDB API
+@memoize_reference_data()
 def fetch_area_list():
+    catalogue = get_local_catalogue()
+    if catalogue:
+        return catalogue.areas
+
     url = 'https://www.themealdb.com/api/json/v1/1/list.php?a=list'
-    response = requests.get(url)
+    response = mealdb_get(url)
     if response.status_code == 200:
         try:
             return [area['strArea'] for area in response.json()['meals']]
@@ -72,12 +1094,29 @@ def fetch_area_list():
         st.error(f"API request failed with status code {response.status_code}")
         return None
 
+# Function to fetch the raw filter.php response for a single ingredient
+def fetch_ingredient_filter(ingredient):
+    url = f'https://www.themealdb.com/api/json/v1/1/filter.php?i={ingredient}'
+    return mealdb_get(url)
+
 # Function to search recipes using TheMealDB API
-def search_recipes_by_ingredients(ingredients):
+def search_recipes_by_ingredients(ingredients, max_workers=None):
     results = []
-    for ingredient in ingredients:
-        url = f'https://www.themealdb.com/api/json/v1/1/filter.php?i={ingredient}'
-        response = requests.get(url)
+    if not ingredients:
+        return results
+
+    catalogue = get_local_catalogue()
+    if catalogue:
+        for ingredient in ingredients:
+            results.extend(catalogue.filter_by_ingredient(ingredient))
+        return results
+
+    # Fan the per-ingredient requests out over a bounded thread pool; map keeps the input order
+    max_workers = min(max_workers or SEARCH_CONCURRENCY, len(ingredients))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = list(executor.map(fetch_ingredient_filter, ingredients))
+
+    for response in responses:
         if response.status_code == 200:
             try:
                 json_response = response.json()
@@ -95,8 +1134,12 @@ def search_recipes_by_ingredients(ingredients):
 
 # Function to search recipes by category and area
 def search_recipes_by_category_and_area(category, area):
+    catalogue = get_local_catalogue()
+    if catalogue:
+        return catalogue.filter_by_category_and_area(category, area)
+
     url = f'https://www.themealdb.com/api/json/v1/1/filter.php?c={category}&a={area}'
-    response = requests.get(url)
+    response = mealdb_get(url)
     if response.status_code == 200:
         try:
             return response.json()['meals']
@@ -107,49 +1150,380 @@ def search_recipes_by_category_and_area(category, area):
         st.error(f"API request failed with status code {response.status_code}")
         return None
 
-# Function to load items from Excel
-def load_items(file_path):
-    return pd.read_excel(file_path)
+# Function to tell whether a file is xlsx, parquet or csv, from its extension or its leading bytes
+def detect_file_format(file_path):
+    if isinstance(file_path, str):
+        extension = os.path.splitext(file_path)[1].lower().lstrip('.')
+        if extension in ('xlsx', 'parquet', 'csv'):
+            return extension
+        with open(file_path, 'rb') as f:
+            magic = f.read(4)
+    else:
+        position = file_path.tell()
+        magic = file_path.read(4)
+        file_path.seek(position)
+    if magic.startswith(b'PK\x03\x04'):
+        return 'xlsx'
+    if magic == b'PAR1':
+        return 'parquet'
+    return 'csv'
+
+# Function to list the sheet names of an Excel workbook
+def list_excel_sheets(file_path):
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+# Function to stream one column of an Excel workbook in chunks of values without loading the workbook into memory
+def iter_excel_column_chunks(file_path, column=PRODUCT_NAME_COLUMN, chunk_size=INGEST_CHUNK_ROWS, sheet_name=None):
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        # Without a chosen sheet, every sheet that has the column contributes
+        sheets = [workbook[sheet_name]] if sheet_name else workbook.worksheets
+        found = False
+        for sheet in sheets:
+            header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            if column not in header:
+                continue
+            found = True
+            column_number = header.index(column) + 1
+
+            chunk = []
+            for (value,) in sheet.iter_rows(min_row=2, min_col=column_number, max_col=column_number, values_only=True):
+                chunk.append(value)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        if not found:
+            raise KeyError(column)
+    finally:
+        workbook.close()
+
+# Function to stream one column of a CSV file in chunks of values
+def iter_csv_column_chunks(file_path, column=PRODUCT_NAME_COLUMN, chunk_size=INGEST_CHUNK_ROWS):
+    # The header is read on its own so a missing column is told apart from decoding and parse errors, which propagate
+    position = None if isinstance(file_path, str) else file_path.tell()
+    header = pd.read_csv(file_path, nrows=0).columns
+    if position is not None:
+        file_path.seek(position)
+    if column not in header:
+        raise KeyError(column)
+
+    with pd.read_csv(file_path, usecols=[column], chunksize=chunk_size) as reader:
+        for frame in reader:
+            yield frame[column].tolist()
+
+# Function to stream one column of a Parquet file in chunks of values, reading no other columns from disk
+def iter_parquet_column_chunks(file_path, column=PRODUCT_NAME_COLUMN, chunk_size=INGEST_CHUNK_ROWS):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(file_path)
+    if column not in parquet_file.schema_arrow.names:
+        raise KeyError(column)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=[column]):
+        yield batch.column(0).to_pylist()
+
+# Function to stream the product name column of an xlsx, csv or parquet file in chunks
+def iter_product_name_chunks(file_path, column=PRODUCT_NAME_COLUMN, sheet_name=None):
+    file_format = detect_file_format(file_path)
+    if file_format == 'xlsx':
+        return iter_excel_column_chunks(file_path, column, sheet_name=sheet_name)
+    if file_format == 'parquet':
+        return iter_parquet_column_chunks(file_path, column)
+    return iter_csv_column_chunks(file_path, column)
+
+# Function to load the distinct, non-empty values of the product name column from an xlsx, csv or parquet file
+def load_items(file_path, column=PRODUCT_NAME_COLUMN, sheet_name=None):
+    # Rows are deduplicated as they stream in, so memory follows the number of distinct products, not rows
+    product_names = {}
+    for chunk in iter_product_name_chunks(file_path, column, sheet_name):
+        for value in chunk:
+            if value is not None and not (isinstance(value, float) and math.isnan(value)):
+                product_names.setdefault(value, None)
+    return pd.DataFrame({column: list(product_names)})
+
+# Function to return a value cached for an upload's bytes in the session, computing it with load on a miss
+def cached_upload_value(data, key, load):
+    cache_key = (hashlib.sha256(data).hexdigest(),) + key
+
+    if 'upload_cache' not in st.session_state:
+        st.session_state.upload_cache = OrderedDict()
+    upload_cache = st.session_state.upload_cache
+    if cache_key in upload_cache:
+        upload_cache.move_to_end(cache_key)
+        return upload_cache[cache_key]
+
+    value = load(io.BytesIO(data))
+    upload_cache[cache_key] = value
+    while len(upload_cache) > UPLOAD_CACHE_ENTRIES:
+        upload_cache.popitem(last=False)
+    return value
+
+# Function to load an uploaded file, reusing the session's earlier parse of the same bytes and sheet
+def load_uploaded_items(uploaded_file, sheet_name=None):
+    return cached_upload_value(
+        uploaded_file.getvalue(), ('items', sheet_name), lambda data: load_items(data, sheet_name=sheet_name)
+    )
+
+# Function to list an uploaded workbook's sheets, reusing the session's earlier scan of the same bytes
+def list_uploaded_sheets(uploaded_file):
+    return cached_upload_value(uploaded_file.getvalue(), ('sheets',), list_excel_sheets)
+
+# Function to clean a column of product names with vectorized string operations
+def clean_product_names(names):
+    prefixes = "|".join(re.escape(prefix) for prefix in sorted(PRODUCT_NAME_PREFIXES, key=len, reverse=True))
+    cleaned = (
+        names.astype("string")
+        .str.lower()
+        # Unit sizes such as "500g", "1.5 l" or "330ml"
+        .str.replace(r"\b\d+(?:[.,]\d+)?[\s-]*(?:kg|g|gr|mg|l|ml|cl|dl|oz|lb|lbs)\b", " ", regex=True)
+        # Pack counts such as "6 x", "x4", "12 pack", "6-pack" or "10 pcs"
+        .str.replace(r"\b\d+[\s-]*x\b|\bx[\s-]*\d+\b|\b\d+[\s-]*(?:pack|pk|pcs|pieces)\b", " ", regex=True)
+        .str.replace(r"[^\w\s]|_", " ", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+        .str.replace(rf"^(?:(?:{prefixes})\s+)+", "", regex=True)
+    )
+    return cleaned.mask(cleaned == "")
+
+# Function to reduce a name to its case-folded, singular lookup key ("Chicken Breasts" -> "chicken breast")
+def ingredient_key(name):
+    words = []
+    for word in re.findall(r"[a-z0-9]+", name.casefold()):
+        if len(word) > 3 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith(("oes", "ches", "shes", "sses", "xes")):
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+            word = word[:-1]
+        words.append(word)
+    return " ".join(words)
+
+# Function to split a lookup key into its set of padded character trigrams
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Hashed and trigram-indexed lookup of product names against the recognized ingredients
+class IngredientMatcher:
+    def __init__(self, recognized_names):
+        self.exact = {}
+        self.folded = {}
+        self.by_key = {}
+        self.trigram_counts = {}
+        self.trigram_index = defaultdict(list)
+        for name in recognized_names:
+            self.exact.setdefault(name, name)
+            self.folded.setdefault(name.strip().casefold(), name)
+            key = ingredient_key(name)
+            if key and key not in self.by_key:
+                self.by_key[key] = name
+                grams = trigrams(key)
+                self.trigram_counts[key] = len(grams)
+                for gram in grams:
+                    self.trigram_index[gram].append(key)
+
+    # Returns (recognized ingredient or None, how the name was matched, similarity score)
+    def match(self, name):
+        if not isinstance(name, str) or not name.strip():
+            return None, "empty name", 0.0
+        if name in self.exact:
+            return self.exact[name], "exact", 1.0
+        if name.strip().casefold() in self.folded:
+            return self.folded[name.strip().casefold()], "case-insensitive", 1.0
+
+        key = ingredient_key(name)
+        if key in self.by_key:
+            return self.by_key[key], "singular/plural", 1.0
+
+        # Fuzzy match: Dice similarity over trigrams shared with indexed ingredient keys
+        grams = trigrams(key)
+        shared = Counter(chain.from_iterable(self.trigram_index.get(gram, ()) for gram in grams))
+        if not shared:
+            return None, "no similar ingredient", 0.0
+        sizes = self.trigram_counts
+        best_key, best_score = max(
+            ((candidate, 2 * overlap / (len(grams) + sizes[candidate])) for candidate, overlap in shared.items()),
+            key=lambda item: item[1],
+        )
+
+        if best_score < FUZZY_MATCH_THRESHOLD:
+            return None, f"closest was '{self.by_key[best_key]}', below threshold", round(best_score, 2)
+        return self.by_key[best_key], "fuzzy", round(best_score, 2)
+
+# Function to get an ingredient matcher for a list of recognized ingredients, built once per list
+@functools.lru_cache(maxsize=4)
+def get_ingredient_matcher(recognized_names):
+    return IngredientMatcher(recognized_names)
+
+# Function to match product names against recognized ingredients and explain each outcome
+def match_ingredients(product_names, recognized_ingredients):
+    matcher = get_ingredient_matcher(tuple(ingredient['strIngredient'] for ingredient in recognized_ingredients))
+    cleaned_names = clean_product_names(pd.Series(product_names, dtype=object)).tolist()
+    report = []
+    seen = {}
+    for name, cleaned_name in zip(product_names, cleaned_names):
+        cleaned_name = cleaned_name if isinstance(cleaned_name, str) else None
+        # The name as uploaded is matched first, since cleaning strips words such as "Frozen" that belong to
+        # ingredient names; the cleaned name is only tried when that finds nothing above the threshold
+        if name not in seen:
+            seen[name] = matcher.match(name)
+        ingredient, reason, score = seen[name]
+        if ingredient is None and cleaned_name and cleaned_name != name:
+            if cleaned_name not in seen:
+                seen[cleaned_name] = matcher.match(cleaned_name)
+            if seen[cleaned_name][0] is not None or seen[cleaned_name][2] > score:
+                ingredient, reason, score = seen[cleaned_name]
+        report.append({'Product Name': name, 'Cleaned Name': cleaned_name, 'Ingredient': ingredient, 'Match': reason, 'Score': score})
+    return report
+
+# Function to split a match report into recognized ingredients and unrecognized product names
+def split_ingredient_matches(report):
+    normalized_names = list(dict.fromkeys(row['Ingredient'] for row in report if row['Ingredient']))
+    not_recognized_names = [row['Product Name'] for row in report if not row['Ingredient']]
+    return normalized_names, not_recognized_names
 
 # Function to normalize ingredient names
 def normalize_ingredients(product_names, recognized_ingredients):
-    recognized_ingredient_names = [ingredient['strIngredient'] for ingredient in recognized_ingredients]
-    normalized_names = [name for name in product_names if name in recognized_ingredient_names]
-    not_recognized_names = [name for name in product_names if name not in recognized_ingredient_names]
-    return normalized_names, not_recognized_names
+    return split_ingredient_matches(match_ingredients(product_names, recognized_ingredients))
 
-# Function to get full details of a recipe by ID
-def get_recipe_details(recipe_id):
+# Function to fetch the raw lookup.php response for a single recipe ID
+def fetch_recipe_lookup(recipe_id):
     url = f'https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}'
-    response = requests.get(url)
+    return mealdb_get(url)
+
+# Function to extract the recipe details from a lookup.php response
+def parse_recipe_details(response):
     if response.status_code == 200:
         try:
             return response.json()['meals'][0]
-        except (ValueError, KeyError):
+        except (ValueError, KeyError, TypeError):
             st.error("Error decoding JSON response")
             return None
     else:
         st.error(f"API request failed with status code {response.status_code}")
         return None
 
+# Function to get full details of a recipe by ID
+def get_recipe_details(recipe_id):
+    catalogue = get_local_catalogue()
+    if catalogue:
+        return catalogue.lookup(recipe_id)
+
+    return parse_recipe_details(fetch_recipe_lookup(recipe_id))
+
+# Function to get full details of many recipes concurrently, keyed by recipe ID
+def get_recipe_details_batch(recipe_ids, max_workers=None):
+    # Meals found under several ingredients are only looked up once
+    unique_ids = list(dict.fromkeys(recipe_ids))
+
+    catalogue = get_local_catalogue()
+    if catalogue:
+        return {recipe_id: catalogue.lookup(recipe_id) for recipe_id in unique_ids}
+
+    if not unique_ids:
+        return {}
+
+    max_workers = min(max_workers or SEARCH_CONCURRENCY, len(unique_ids))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = list(executor.map(fetch_recipe_lookup, unique_ids))
+
+    return {recipe_id: parse_recipe_details(response) for recipe_id, response in zip(unique_ids, responses)}
+
+# Function to count how many of the given ingredients a recipe uses
+def count_matching_ingredients(recipe_details, ingredient_names):
+    recipe_ingredients = {recipe_details.get(f'strIngredient{i}') for i in range(1, 21)}
+    return len(recipe_ingredients & ingredient_names)
+
+# Function to find the recipe using the most of the given ingredients
+def find_best_recipe(recipes, normalized_names, max_workers=None):
+    # A meal is listed once per ingredient it was found under, so its number of
+    # occurrences is an upper bound on how many ingredients it can match
+    upper_bounds = Counter(recipe['idMeal'] for recipe in recipes)
+    candidate_ids = sorted(upper_bounds, key=upper_bounds.get, reverse=True)
+    ingredient_names = set(normalized_names)
+    batch_size = max_workers or SEARCH_CONCURRENCY
+
+    best_recipe = None
+    best_match_count = 0
+    for start in range(0, len(candidate_ids), batch_size):
+        batch = candidate_ids[start:start + batch_size]
+        # Candidates are sorted by bound, so nothing left can beat the current best
+        if upper_bounds[batch[0]] <= best_match_count:
+            break
+
+        recipe_details = get_recipe_details_batch(batch, max_workers)
+        for recipe_id in batch:
+            details = recipe_details.get(recipe_id)
+            if details:
+                match_count = count_matching_ingredients(details, ingredient_names)
+                if match_count > best_match_count:
+                    best_match_count = match_count
+                    best_recipe = details
+    return best_recipe
+
+# Function to rank recipes by how many of the given ingredients they use, as (details, match count) pairs
+def rank_recipes(recipes, normalized_names, top_k=TOP_RECIPE_MATCHES):
+    catalogue = get_local_catalogue()
+    if catalogue:
+        return catalogue.rank_by_ingredients(normalized_names, top_k)
+
+    # Without a local catalogue only the single best match is worth the API lookups
+    best_recipe = find_best_recipe(recipes, normalized_names)
+    if not best_recipe:
+        return []
+    return [(best_recipe, count_matching_ingredients(best_recipe, set(normalized_names)))]
+
 # Main function for the Streamlit app
 def main():
     # Setting up the Streamlit app's title with centered CSS
     st.markdown("<h1 style='text-align: center;'>Lumine Application</h1>", unsafe_allow_html=True)
 
-    tab1, tab2, tab3, tab4 = st.tabs(["Chat with Chef 🤖", "Your Recipe Haven 🏠", "Recipe Roulette 🎲", "Magic Recipe Mixer 🍲"])
+    # Preload the chat models in the background so the first question does not pay the load cost
+    start_model_warm_up()
+
+    # Only the selected page runs, so other pages do no network or model work on this rerun
+    pages = {
+        "Chat with Chef 🤖": chatbot_tab,
+        "Your Recipe Haven 🏠": upload_products_tab,
+        "Recipe Roulette 🎲": select_filters_tab,
+        "Magic Recipe Mixer 🍲": recipe_page,
+    }
+    page = st.sidebar.radio("Navigate", list(pages), key="page")
 
-    with tab1:
-        chatbot_tab()
+    # Rendered before the page, whose polling reruns would otherwise stop the script before the sidebar is drawn
+    operator_stats_sidebar()
 
-    with tab2:
-        upload_products_tab()
+    pages[page]()
 
-    with tab3:
-        select_filters_tab()
+# Sidebar panel showing cache and HTTP statistics for operators
+def operator_stats_sidebar():
+    with st.sidebar.expander("Operator stats"):
+        st.write("**Reference data memo**")
+        st.json(get_memo_store().summary())
+        st.write("**TheMealDB response cache**")
+        st.json(get_response_cache().summary())
+        st.write("**TheMealDB HTTP client**")
+        st.json(get_http_client().summary())
+        st.write("**Chatbot response cache**")
+        st.json(get_chat_response_cache().summary())
+        st.write("**Inference queue**")
+        st.json(get_inference_scheduler().summary())
+        st.write("**Ollama hosts**")
+        st.json(get_ollama_router().summary())
+        st.write("**Generation tokens**")
+        st.json(get_generation_stats().summary())
+        st.write("**Model warm-up**")
+        st.json(start_model_warm_up())
 
-    with tab4:
-        recipe_page()
+        if st.button("Refresh reference data", key="operator_invalidate_memo"):
+            refresh_reference_data()
+        if st.button("Clear response cache", key="operator_clear_response_cache"):
+            get_response_cache().clear()
 
 # ChatBot tab function
 def chatbot_tab():
@@ -164,37 +1538,67 @@ def chatbot_tab():
         st.session_state.history = []
     if 'user_input' not in st.session_state:
         st.session_state.user_input = ""
-
+    if 'chat_memory' not in st.session_state:
+        st.session_state.chat_memory = {'summary': "", 'turns': []}
 
     # Model selection
     model_choice = st.selectbox(
         "Choose a Chef:",
-        ("Chef De-Code", "Chef App-etizer")
+        list(MODEL_CATALOGUE)
     )
 
     # User input with pre-written text
     default_text = "Could you suggest me a recipe with chicken, potatoes and vegetables?"
     user_input = st.text_input("Aspiring Chef:", value=default_text, key="input", on_change=lambda: st.session_state.update(user_input=st.session_state.input))
 
+    # Collect a background generation that finished since the last rerun
+    chat_job = st.session_state.get('chat_job')
+    if chat_job and chat_job['job'].done.is_set():
+        finish_chat_job(chat_job)
+        chat_job = None
+
+    # Start over with an empty conversation
+    if st.button("New Conversation"):
+        cancel_chat_job()
+        chat_job = None
+        st.session_state.history = []
+        st.session_state.chat_memory = {'summary': "", 'turns': []}
+
     # Generate response when the user submits input
     if st.button("Let's Cook"):
         if user_input:
-            # Clear previous conversation
-            st.session_state.history = []
+            # A new question replaces any generation still running for this session
+            cancel_chat_job()
+            chat_job = None
+            chat_memory = st.session_state.chat_memory
+            first_turn = not chat_memory['turns'] and not chat_memory['summary']
 
             # Append user input to history
             st.session_state.history.append(f"Aspiring Chef: {user_input}")
 
-            # Show loading spinner and status message
-            with st.spinner("Lumine's cooking up a response... Almost ready! 🍳✨"):
-                # Generate response based on the selected model
-                if model_choice == "gemma:2b":
-                    bot_response = generate_response_gemma(user_input)
-                else:
-                    bot_response = generate_response_llama(user_input)
+            # Serve repeated opening prompts from the response cache; follow-ups depend on the conversation
+            model_id = MODEL_CATALOGUE[model_choice]['model']
+            bot_response, st.session_state.cache_hit = get_chat_response_cache().get(model_id, user_input) if first_turn else (None, None)
+            st.session_state.generation_metrics = None
+
+            if bot_response is None:
+                # Queue the generation for the selected model behind other sessions' requests
+                generation_metrics = {}
+                stream_fn = functools.partial(stream_response, model_choice, metrics=generation_metrics)
+                prompt, grounding_recipes = build_prompt(model_choice, user_input, chat_memory)
+                st.session_state.grounding_recipes = [meal['strMeal'] for meal in grounding_recipes]
+                job = get_inference_scheduler().submit(stream_fn, prompt)
 
-            # Append bot response to history
-            st.session_state.history.append(f"Culinary Luminary: {bot_response}")
+                if job is None:
+                    st.session_state.history.append("Culinary Luminary: Lumine's kitchen is fully booked right now. Please try again in a moment! 🍽️")
+                else:
+                    # The generation runs in the background; later reruns poll this handle or cancel it
+                    chat_job = {'job': job, 'user_input': user_input, 'model_id': model_id, 'first_turn': first_turn, 'metrics': generation_metrics}
+                    st.session_state.chat_job = chat_job
+            else:
+                remember_turn(chat_memory, user_input, bot_response)
+                st.session_state.history.append(f"Culinary Luminary: {bot_response}")
+            st.session_state.history = st.session_state.history[-CHAT_HISTORY_MAX_MESSAGES:]
 
             # Clear input
             st.session_state.user_input = ""
@@ -206,22 +1610,91 @@ def chatbot_tab():
         elif message.startswith("Culinary Luminary:"):
             st.success(message)
 
+    # Show the running generation and poll it again shortly; any widget interaction interrupts the wait
+    if chat_job:
+        job = chat_job['job']
+        queued = not job.started.is_set()
+        if queued:
+            st.info(f"Lumine's kitchen is busy — you're #{get_inference_scheduler().position(job)} in line... 🧑‍🍳")
+        elif job.text:
+            st.success(f"Culinary Luminary: {job.text}▌")
+        else:
+            st.info("Lumine's cooking up a response... Almost ready! 🍳✨")
+
+        if st.button("Stop Cooking"):
+            cancel_chat_job()
+            st.experimental_rerun()
+        time.sleep(CHAT_QUEUED_POLL_SECONDS if queued else CHAT_POLL_SECONDS)
+        st.experimental_rerun()
+
+    if st.session_state.history and st.session_state.get('grounding_recipes') and not st.session_state.get('cache_hit'):
+        st.caption("📖 From Lumine's recipe book: " + ", ".join(st.session_state.grounding_recipes))
+    generation_metrics = st.session_state.get('generation_metrics')
+    if st.session_state.history and generation_metrics and not st.session_state.get('cache_hit'):
+        st.caption(
+            f"🧮 {generation_metrics['prompt_tokens']} prompt tokens, {generation_metrics['completion_tokens']} completion tokens, "
+            f"{generation_metrics.get('tokens_per_second', 0.0):.1f} tokens/s, {generation_metrics['seconds']:.1f}s total"
+        )
+    if st.session_state.history and st.session_state.get('cache_hit'):
+        st.caption(f"⚡ Served instantly from Lumine's recipe memory ({st.session_state.cache_hit} match)")
+
+# Function to add a finished background generation to the conversation, its memory and the response cache
+def finish_chat_job(chat_job):
+    bot_response = chat_job['job'].text
+    # A failed generation is shown but never cached or remembered, even when it streamed part of an answer first
+    if not (chat_job['job'].error or chat_job['metrics'].get('error')):
+        if chat_job['first_turn']:
+            get_chat_response_cache().put(chat_job['model_id'], chat_job['user_input'], bot_response)
+        remember_turn(st.session_state.chat_memory, chat_job['user_input'], bot_response)
+    st.session_state.generation_metrics = chat_job['metrics']
+    st.session_state.history.append(f"Culinary Luminary: {bot_response}")
+    st.session_state.history = st.session_state.history[-CHAT_HISTORY_MAX_MESSAGES:]
+    st.session_state.chat_job = None
+
+# Function to cancel the session's running generation so it stops using the inference host
+def cancel_chat_job():
+    chat_job = st.session_state.get('chat_job')
+    if not chat_job:
+        return
+    get_inference_scheduler().cancel(chat_job['job'])
+    partial_response = chat_job['job'].text.strip()
+    st.session_state.history.append(f"Culinary Luminary: {partial_response} (stopped)" if partial_response else "Culinary Luminary: (stopped)")
+    st.session_state.chat_job = None
+
 # Upload products tab function
 def upload_products_tab():
     st.title("Ready to showcase your discounted products?")
     st.write("""
-    Simply upload your Excel file with the column 'Product Name' populated with all your bargain buys. Let's celebrate those smart shopping successes together! Minimize waste, maximize savings!
+    Simply upload your Excel, CSV or Parquet file with the column 'Product Name' populated with all your bargain buys. Let's celebrate those smart shopping successes together! Minimize waste, maximize savings!
     """)
 
-    uploaded_file = st.file_uploader("Choose an Excel file", type="xlsx", key="uploader")
+    uploaded_file = st.file_uploader("Choose a product file", type=["xlsx", "csv", "parquet"], key="uploader")
 
     if uploaded_file:
-        df = load_items(uploaded_file)
+        # Workbooks with several sheets can be read whole or one sheet at a time
+        sheet_name = None
+        if detect_file_format(uploaded_file) == 'xlsx':
+            sheet_names = list_uploaded_sheets(uploaded_file)
+            if len(sheet_names) > 1:
+                choice = st.selectbox("Choose a sheet", ["All sheets"] + sheet_names, key="uploader_sheet")
+                sheet_name = None if choice == "All sheets" else choice
+
+        try:
+            df = load_uploaded_items(uploaded_file, sheet_name)
+        except KeyError:
+            st.error(f"Your file needs a '{PRODUCT_NAME_COLUMN}' column in its first row.")
+            return
+        except UnicodeDecodeError:
+            st.error("Your CSV file isn't UTF-8 encoded. Please save it as 'CSV UTF-8' and upload it again.")
+            return
+        except pd.errors.ParserError as e:
+            st.error(f"Your CSV file couldn't be read: {e}")
+            return
         st.write("### Your Purchased Discounted Products")
         st.write(df)
 
         # Extract product names
-        product_names = df['Product Name'].unique().tolist()
+        product_names = df[PRODUCT_NAME_COLUMN].tolist()
 
         # Fetch recognized ingredients from TheMealDB API
         with st.spinner("Fetching recognized Lumine's ingredients..."):
@@ -229,28 +1702,31 @@ def upload_products_tab():
 
         if recognized_ingredients:
             # Normalize ingredient names
-            normalized_names, not_recognized_names = normalize_ingredients(product_names, recognized_ingredients)
+            ingredient_matches = match_ingredients(product_names, recognized_ingredients)
+            normalized_names, not_recognized_names = split_ingredient_matches(ingredient_matches)
+
+            with st.expander(f"Matched {len(normalized_names)} ingredients, {len(not_recognized_names)} products not recognized"):
+                st.dataframe(pd.DataFrame(ingredient_matches))
 
             if st.button("Let's Spice Things Up", key="upload_get_recipes"):
                 with st.spinner("Fetching Lumine's recipes..."):
                     recipes = search_recipes_by_ingredients(normalized_names)
 
                 if recipes:
-                    st.success("Recipes unlocked! Head to the 'Recipe Generator' tab for the perfect match.")
-
-                    # Find the recipe with the most matching ingredients
-                    best_recipe = None
-                    best_match_count = 0
-                    for recipe in recipes:
-                        recipe_details = get_recipe_details(recipe['idMeal'])
-                        if recipe_details:
-                            match_count = sum(1 for i in range(1, 21) if recipe_details.get(f'strIngredient{i}') in normalized_names)
-                            if match_count > best_match_count:
-                                best_match_count = match_count
-                                best_recipe = recipe_details
-
-                    if best_recipe:
-                        st.session_state['best_recipe'] = best_recipe
+                    st.success("Recipes unlocked! Head to the 'Magic Recipe Mixer 🍲' page for the perfect match.")
+
+                    # Rank the recipes by how many of the products they use
+                    with st.spinner("Picking Lumine's best match..."):
+                        ranked_recipes = rank_recipes(recipes, normalized_names)
+
+                    if ranked_recipes:
+                        st.session_state['best_recipe'] = ranked_recipes[0][0]
+                        if len(ranked_recipes) > 1:
+                            st.write("### Top Matches")
+                            st.table(pd.DataFrame(
+                                [(recipe['strMeal'], match_count) for recipe, match_count in ranked_recipes],
+                                columns=["Recipe", "Matching Products"],
+                            ))
                     else:
                         st.write("Oops! No recipes found with those ingredients. Time to get creative or try a different combo!")
                 else:
@@ -279,7 +1755,7 @@ def select_filters_tab():
                 return
 
         if recipes:
-            st.success("Recipes unlocked! Head to the 'Recipe Generator' tab for the perfect match.")
+            st.success("Recipes unlocked! Head to the 'Magic Recipe Mixer 🍲' page for the perfect match.")
 
             # Find the best matching recipe
             best_recipe = recipes[0] if recipes else None
@@ -315,5 +1791,204 @@ def recipe_page():
     else:
         st.write("No recipe selected! Head back to the Home tab for some culinary inspiration.")
 
+# Function to read batch prompts from a text file (one per line) or JSONL file ({"id": ..., "prompt": ...} per line)
+def read_batch_prompts(path):
+    prompts = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith('.jsonl'):
+                item = json.loads(line)
+                prompts.append((str(item.get('id', line_number)), item['prompt']))
+            else:
+                prompts.append((str(line_number), line))
+    return prompts
+
+# Function to answer a file of prompts with a chef's model, appending one JSON result per prompt and resuming past finished ones
+def run_batch_chat(input_path, output_path, chef, parallelism):
+    prompts = read_batch_prompts(input_path)
+
+    # Prompts answered successfully by an earlier run are skipped; failed ones are retried
+    finished_ids = set()
+    truncated = False
+    if os.path.exists(output_path):
+        with open(output_path, encoding='utf-8') as f:
+            for line in f:
+                # A run killed mid-write can leave a truncated last line; that prompt is simply run again
+                truncated = not line.endswith("\n")
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                if not result.get('error'):
+                    finished_ids.add(result['id'])
+    pending = [(prompt_id, prompt) for prompt_id, prompt in prompts if prompt_id not in finished_ids]
+    print(f"{len(prompts)} prompts, {len(prompts) - len(pending)} already done, {len(pending)} to run with {chef}")
+
+    def answer(prompt_id, prompt):
+        metrics = {}
+        started_at = time.perf_counter()
+        full_prompt, _ = build_prompt(chef, prompt)
+        response = generate_response(chef, full_prompt, metrics)
+        return {
+            'id': prompt_id,
+            'chef': chef,
+            'model': MODEL_CATALOGUE[chef]['model'],
+            'prompt': prompt,
+            'response': response,
+            'error': 'error' in metrics,
+            'latency_seconds': round(time.perf_counter() - started_at, 3),
+            'prompt_tokens': metrics.get('prompt_tokens'),
+            'completion_tokens': metrics.get('completion_tokens'),
+        }
+
+    with open(output_path, 'a', encoding='utf-8') as output, ThreadPoolExecutor(max_workers=parallelism) as executor:
+        # New results start on a line of their own rather than continuing a truncated one
+        if truncated:
+            output.write("\n")
+        futures = [executor.submit(answer, prompt_id, prompt) for prompt_id, prompt in pending]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                # Each result is flushed as soon as it is written so an interrupted run loses nothing finished
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+                print(f"[{done}/{len(pending)}] {result['id']} in {result['latency_seconds']}s{' (error)' if result['error'] else ''}")
+        except KeyboardInterrupt:
+            # Drop the queued prompts so Ctrl-C only waits for the generations already running
+            executor.shutdown(wait=False, cancel_futures=True)
+            sys.exit("Interrupted; run the same command again to resume")
+
+# Function to time load_items against a full pandas read on product files, defaulting to the bundled samples
+def benchmark_loaders(paths, repeats=5):
+    if not paths:
+        sample_dir = os.path.dirname(os.path.abspath(__file__))
+        paths = [os.path.join(sample_dir, name) for name in ("Products.xlsx", "Products Names.xlsx", "Josh.xlsx")]
+
+    full_readers = {'xlsx': pd.read_excel, 'csv': pd.read_csv, 'parquet': pd.read_parquet}
+    print(f"{'file':<40} {'format':<8} {'products':>8} {'load_items ms':>14} {'full read ms':>13}")
+    for path in paths:
+        file_format = detect_file_format(path)
+        timings = {}
+        for name, load in (('load_items', load_items), ('full read', full_readers[file_format])):
+            best = float('inf')
+            for _ in range(repeats):
+                started_at = time.perf_counter()
+                result = load(path)
+                best = min(best, time.perf_counter() - started_at)
+            timings[name] = best * 1000
+            if name == 'load_items':
+                product_count = len(result)
+        print(f"{os.path.basename(path):<40} {file_format:<8} {product_count:>8} {timings['load_items']:>14.1f} {timings['full read']:>13.1f}")
+
+# Reference data each batch-stores worker process receives once from its initializer
+STORE_WORKER_STATE = {}
+
+# Function to set up a batch-stores worker process with the shared catalogue and ingredient matcher
+def init_store_worker(catalogue):
+    STORE_WORKER_STATE['catalogue'] = catalogue
+    get_ingredient_matcher(tuple(ingredient['strIngredient'] for ingredient in catalogue.ingredients))
+
+# Function to rank recipes for one store's product sheet and write them to a JSON file, returning a summary row
+def recommend_for_store(path, store, output_dir, top_k):
+    catalogue = STORE_WORKER_STATE['catalogue']
+    try:
+        product_names = load_items(path)[PRODUCT_NAME_COLUMN].tolist()
+    except KeyError:
+        return {'store': store, 'error': f"missing '{PRODUCT_NAME_COLUMN}' column"}
+
+    normalized_names, not_recognized_names = normalize_ingredients(product_names, catalogue.ingredients)
+    ranked_recipes = catalogue.rank_by_ingredients(normalized_names, top_k)
+    result = {
+        'store': store,
+        'source': path,
+        'products': len(product_names),
+        'matched_ingredients': normalized_names,
+        'not_recognized': not_recognized_names,
+        'recipes': [
+            {'idMeal': recipe['idMeal'], 'strMeal': recipe['strMeal'], 'matching_products': match_count}
+            for recipe, match_count in ranked_recipes
+        ],
+    }
+    with open(os.path.join(output_dir, f"{store}.json"), 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    return {'store': store, 'products': len(product_names), 'matched': len(normalized_names), 'top_recipe': ranked_recipes[0][0]['strMeal'] if ranked_recipes else None}
+
+# Function to rank recipes for every product sheet in a directory across a pool of worker processes
+def run_store_batch(input_dir, output_dir, processes, top_k):
+    catalogue = get_local_catalogue()
+    if catalogue is None:
+        sys.exit(f"No local catalogue at {MEALDB_CATALOGUE_PATH}; run `python Streamlit.py sync-catalogue` first.")
+
+    paths = sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if os.path.splitext(name)[1].lower() in ('.xlsx', '.csv', '.parquet')
+    )
+    if not paths:
+        print(f"No xlsx, csv or parquet product sheets in {input_dir}")
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Ranking recipes for {len(paths)} stores with {processes or os.cpu_count()} processes")
+
+    # Stores are named after their file; files sharing a name ("a.xlsx" and "a.csv") keep the extension so their results do not overwrite each other
+    stems = Counter(os.path.splitext(os.path.basename(path))[0] for path in paths)
+    stores = {}
+    for path in paths:
+        name = os.path.basename(path)
+        stem = os.path.splitext(name)[0]
+        stores[path] = stem if stems[stem] == 1 else name
+
+    # The catalogue is loaded once here and handed to each worker when it starts, not reloaded per store
+    summaries = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_store_worker, initargs=(catalogue,)) as executor:
+        futures = {executor.submit(recommend_for_store, path, stores[path], output_dir, top_k): path for path in paths}
+        for future in as_completed(futures):
+            # An unreadable file fails only its own store, so the rest of the run and summary.csv still complete
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {'store': stores[futures[future]], 'error': str(e)}
+            summaries.append(summary)
+            print(summary)
+
+    pd.DataFrame(summaries).convert_dtypes().sort_values('store').to_csv(os.path.join(output_dir, "summary.csv"), index=False)
+
+# Command-line entry point for maintenance commands, e.g. `python Streamlit.py sync-catalogue`
+def cli(argv):
+    parser = argparse.ArgumentParser(prog="Streamlit.py", description="Lumine maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser("sync-catalogue", help="Snapshot the full TheMealDB catalogue for offline use")
+    sync_parser.add_argument("--path", default=MEALDB_CATALOGUE_PATH, help="Where to write the catalogue snapshot")
+    sync_parser.set_defaults(handler=lambda args: sync_catalogue(args.path))
+
+    batch_chat_parser = subparsers.add_parser("batch-chat", help="Answer a file of cooking questions and write the results as JSONL")
+    batch_chat_parser.add_argument("input", help="Text file with one prompt per line, or JSONL with id and prompt fields")
+    batch_chat_parser.add_argument("--output", default="batch_chat_results.jsonl", help="JSONL file results are appended to")
+    batch_chat_parser.add_argument("--chef", default=next(iter(MODEL_CATALOGUE)), choices=list(MODEL_CATALOGUE), help="Chef whose model answers")
+    batch_chat_parser.add_argument("--parallelism", type=int, default=INFERENCE_WORKERS, help="Prompts generated at the same time")
+    batch_chat_parser.set_defaults(handler=lambda args: run_batch_chat(args.input, args.output, args.chef, args.parallelism))
+
+    bench_parser = subparsers.add_parser("bench-load", help="Time product file loading, by default on the bundled sample sheets")
+    bench_parser.add_argument("paths", nargs="*", help="xlsx, csv or parquet files to load")
+    bench_parser.add_argument("--repeats", type=int, default=5, help="Runs per file; the best time is reported")
+    bench_parser.set_defaults(handler=lambda args: benchmark_loaders(args.paths, args.repeats))
+
+    stores_parser = subparsers.add_parser("batch-stores", help="Rank recipes for every store's product sheet in a directory")
+    stores_parser.add_argument("input_dir", help="Directory of xlsx, csv or parquet product sheets, one per store")
+    stores_parser.add_argument("--output", default="store_recommendations", help="Directory the per-store JSON files and summary.csv go to")
+    stores_parser.add_argument("--processes", type=int, default=None, help="Worker processes (defaults to the number of cores)")
+    stores_parser.add_argument("--top-k", type=int, default=TOP_RECIPE_MATCHES, help="Recipes ranked per store")
+    stores_parser.set_defaults(handler=lambda args: run_store_batch(args.input_dir, args.output, args.processes, args.top_k))
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
 if __name__ == "__main__":
-    main()
+    # `streamlit run Streamlit.py` runs the app; extra arguments select a maintenance command
+    if len(sys.argv) > 1:
+        cli(sys.argv[1:])
+    else:
+        main()